@@ -0,0 +1,223 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Tuple
+
+from fastapi import Depends, HTTPException, status
+from auth import get_current_user
+from models.user import UserInDB, UserRole
+
+# Requests per second and burst size allowed per user, by role
+ROLE_RATE_LIMITS: Dict[UserRole, Tuple[float, int]] = {
+    UserRole.USER: (
+        float(os.getenv("USER_RATE_PER_SEC", "1")),
+        int(os.getenv("USER_RATE_BURST", "5"))
+    ),
+    UserRole.ADMIN: (
+        float(os.getenv("ADMIN_RATE_PER_SEC", "5")),
+        int(os.getenv("ADMIN_RATE_BURST", "20"))
+    )
+}
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def is_full(self, now: float) -> bool:
+        """Whether the bucket has refilled, making it no different from a new one"""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+    def take(self, cost: int = 1) -> float:
+        """Take tokens, returning 0 on success or the seconds until one is available.
+
+        A request is admitted whenever at least one token is available, and
+        larger costs put the bucket into debt, so big requests are paid for
+        by waiting longer before the next one.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= cost
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RouteLane:
+    """Bounded concurrency for one route, with a bounded wait queue.
+
+    Admins wait in their own queue, which is always served first when a
+    slot frees up.
+    """
+
+    def __init__(self, concurrency: int, max_queue: int):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiters: Dict[bool, Deque[asyncio.Future]] = {True: deque(), False: deque()}
+        # Moving average of time a request holds a slot, for Retry-After hints
+        self.avg_service_time = 1.0
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self.waiters[True]) + len(self.waiters[False])
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.avg_service_time * (self.queued + 1) / self.concurrency))
+
+    def _has_free_slot(self) -> bool:
+        return self.active < self.concurrency and not self.queued
+
+    def check_room(self, priority: bool):
+        """Reject with 429 if the request could neither run nor queue"""
+        if not self._has_free_slot() and len(self.waiters[priority]) >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Server busy, please retry later",
+                headers={"Retry-After": str(self.retry_after())}
+            )
+
+    async def acquire(self, priority: bool):
+        if self._has_free_slot():
+            self.active += 1
+            self.admitted += 1
+            return
+
+        self.check_room(priority)
+        queue = self.waiters[priority]
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before cancellation
+                self.release(0.0)
+            else:
+                queue.remove(waiter)
+            raise
+        self.admitted += 1
+
+    def release(self, service_time: float):
+        if service_time:
+            self.avg_service_time = 0.9 * self.avg_service_time + 0.1 * service_time
+        for priority in (True, False):
+            queue = self.waiters[priority]
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    # Hand the slot straight to the next waiter
+                    waiter.set_result(None)
+                    return
+        self.active -= 1
+
+# How often buckets that have fully refilled are dropped, in seconds
+BUCKET_PRUNE_INTERVAL = 60
+
+class AdmissionController:
+    """Per-user token buckets plus per-route concurrency lanes"""
+
+    def __init__(self, routes: Dict[str, Tuple[int, int]]):
+        self.lanes = {
+            route: RouteLane(concurrency, max_queue)
+            for route, (concurrency, max_queue) in routes.items()
+        }
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.rate_limited: Dict[str, int] = {route: 0 for route in routes}
+        self.pruned_at = time.monotonic()
+
+    def _prune_buckets(self):
+        # A full bucket behaves exactly like a new one, so idle users cost nothing
+        now = time.monotonic()
+        if now - self.pruned_at < BUCKET_PRUNE_INTERVAL:
+            return
+        self.pruned_at = now
+        for email in [email for email, bucket in self.buckets.items() if bucket.is_full(now)]:
+            del self.buckets[email]
+
+    def _check_rate(self, route: str, user: UserInDB, cost: int = 1):
+        self._prune_buckets()
+        bucket = self.buckets.get(user.email)
+        rate, burst = ROLE_RATE_LIMITS[UserRole(user.role)]
+        if bucket is None or bucket.rate != rate:
+            bucket = self.buckets[user.email] = TokenBucket(rate, burst)
+
+        wait = bucket.take(cost)
+        if wait:
+            self.rate_limited[route] += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
+
+    async def enter(self, route: str, user: UserInDB, cost: int = 1) -> float:
+        """Charge the user's bucket and take a slot on the route; returns the start time"""
+        lane = self.lanes[route]
+        priority = user.role == UserRole.ADMIN
+        # A request turned away by a full queue must not spend the user's tokens.
+        # Nothing awaits between here and acquire, so the room cannot vanish.
+        lane.check_room(priority)
+        self._check_rate(route, user, cost)
+        await lane.acquire(priority)
+        return time.monotonic()
+
+    def leave(self, route: str, start: float):
+        self.lanes[route].release(time.monotonic() - start)
+
+    async def hold(self, route: str, user: UserInDB, cost: int = 1) -> Callable[[], None]:
+        """Like enter, but returns a release callback that only takes effect once.
+
+        Lets a streamed response release its slot from every cleanup path,
+        whether or not the stream ever started.
+        """
+        start = await self.enter(route, user, cost)
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.leave(route, start)
+
+        return release
+
+    def admit(self, route: str):
+        """Dependency that authenticates the user and holds a slot on the route"""
+        async def dependency(current_user: UserInDB = Depends(get_current_user)):
+            start = await self.enter(route, current_user)
+            try:
+                yield current_user
+            finally:
+                self.leave(route, start)
+
+        return dependency
+
+    def metrics(self) -> str:
+        """Queue depths and rejection counters in Prometheus text format"""
+        lines = ["# TYPE admission_active gauge"]
+        lines += [
+            f'admission_active{{route="{route}"}} {lane.active}'
+            for route, lane in self.lanes.items()
+        ]
+        lines.append("# TYPE admission_queue_depth gauge")
+        for route, lane in self.lanes.items():
+            lines.append(f'admission_queue_depth{{route="{route}",lane="admin"}} {len(lane.waiters[True])}')
+            lines.append(f'admission_queue_depth{{route="{route}",lane="user"}} {len(lane.waiters[False])}')
+        lines.append("# TYPE admission_admitted_total counter")
+        lines += [
+            f'admission_admitted_total{{route="{route}"}} {lane.admitted}'
+            for route, lane in self.lanes.items()
+        ]
+        lines.append("# TYPE admission_rejected_total counter")
+        for route, lane in self.lanes.items():
+            lines.append(f'admission_rejected_total{{route="{route}",reason="queue_full"}} {lane.rejected}')
+            lines.append(f'admission_rejected_total{{route="{route}",reason="rate_limit"}} {self.rate_limited[route]}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,126 @@
+import os
+from typing import Optional
+
+import httpx
+import pinecone
+from pinecone.core.client.configuration import Configuration as OpenApiConfiguration
+from storage3.utils import SyncClient
+from supabase import Client, create_client
+from supabase.lib.client_options import ClientOptions
+from supabase.lib.storage_client import SupabaseStorageClient
+
+# Connection pool and timeout settings shared by the external service clients
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_KEEPALIVE = int(os.getenv("HTTP_KEEPALIVE", "10"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_POOL_SIZE,
+        max_keepalive_connections=HTTP_KEEPALIVE
+    )
+
+def _httpx_pool_stats(session: httpx.Client) -> dict:
+    """Open and in-use connections of an httpx client's pool.
+
+    This reads httpcore internals, so if they change after an upgrade the
+    counts are reported as None instead of breaking the health probe.
+    """
+    stats = {"max_connections": HTTP_POOL_SIZE, "open": None, "in_use": None}
+    try:
+        connections = list(session._transport._pool.connections)
+        stats["open"] = len(connections)
+        stats["in_use"] = sum(1 for c in connections if not c.is_idle())
+    except (AttributeError, TypeError):
+        pass
+    return stats
+
+class PooledStorageClient(SupabaseStorageClient):
+    """Storage client whose session uses the same pool limits as PostgREST"""
+
+    def _create_session(self, base_url: str, headers: dict, timeout: int) -> SyncClient:
+        return SyncClient(base_url=base_url, headers=headers, timeout=timeout, limits=_pool_limits())
+
+class ServiceClients:
+    """Long-lived Supabase and Pinecone clients, created once per process.
+
+    Built by the FastAPI lifespan handler and shared by every request, so
+    connections are pooled and kept alive instead of being rebuilt per call.
+    """
+
+    def __init__(self):
+        self.supabase: Optional[Client] = None
+        self.storage = None
+        self.pinecone_index: Optional[pinecone.Index] = None
+
+    def open(self):
+        self.supabase = create_client(
+            os.getenv("SUPABASE_URL"),
+            os.getenv("SUPABASE_KEY"),
+            options=ClientOptions(
+                postgrest_client_timeout=HTTP_TIMEOUT,
+                storage_client_timeout=HTTP_TIMEOUT
+            )
+        )
+        # Swap the default PostgREST session for one with a tuned pool
+        default_session = self.supabase.postgrest.session
+        self.supabase.postgrest.session = httpx.Client(
+            base_url=default_session.base_url,
+            headers=default_session.headers,
+            timeout=HTTP_TIMEOUT,
+            limits=_pool_limits()
+        )
+        default_session.close()
+        # Rebuild storage, which carries the large uploads, on a tuned pool too
+        default_storage = self.supabase.storage
+        self.storage = PooledStorageClient(
+            str(default_storage.session.base_url),
+            dict(default_storage.session.headers),
+            HTTP_TIMEOUT
+        )
+        default_storage.session.close()
+
+        openapi_config = OpenApiConfiguration.get_default_copy()
+        openapi_config.connection_pool_maxsize = HTTP_POOL_SIZE
+        pinecone.init(
+            api_key=os.getenv("PINECONE_API_KEY"),
+            environment=os.getenv("PINECONE_ENVIRONMENT"),
+            host=os.getenv("PINECONE_HOST"),
+            openapi_config=openapi_config
+        )
+        self.pinecone_index = pinecone.Index(
+            os.getenv("PINECONE_INDEX_NAME", "arya-embeddings")
+        )
+
+    def close(self):
+        if self.supabase is not None:
+            self.supabase.postgrest.session.close()
+            self.storage.session.close()
+        if self.pinecone_index is not None:
+            self.pinecone_index.close()
+            self.pinecone_index.rest_client.pool_manager.clear()
+        self.supabase = self.storage = self.pinecone_index = None
+
+    def pool_stats(self) -> dict:
+        """Connection pool utilization for health probes"""
+        stats = {"supabase": None, "storage": None, "pinecone": None}
+
+        if self.supabase is not None:
+            stats["supabase"] = _httpx_pool_stats(self.supabase.postgrest.session)
+            stats["storage"] = _httpx_pool_stats(self.storage.session)
+
+        if self.pinecone_index is not None:
+            stats["pinecone"] = {"max_connections": HTTP_POOL_SIZE, "hosts": None, "in_use": None}
+            try:
+                pool_manager = self.pinecone_index.rest_client.pool_manager
+                pools = [pool_manager.pools[key] for key in pool_manager.pools.keys()]
+                # urllib3 pools hold a queue of free slots, so in-use is maxsize minus free
+                stats["pinecone"]["hosts"] = len(pools)
+                stats["pinecone"]["in_use"] = sum(
+                    pool.pool.maxsize - pool.pool.qsize()
+                    for pool in pools if pool.pool is not None
+                )
+            except (AttributeError, TypeError):
+                pass
+
+        return stats
@@ -1,8 +1,13 @@
-from supabase import create_client
+from supabase import Client
 import os
 import magic
-from models.document import Document, FileType
-from typing import List, Tuple
+from models.document import Document, DocumentPage, DocumentSummary, FileType
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from datetime import datetime
+import base64
+import hashlib
+import time
 import uuid
 from pypdf import PdfReader
 from io import BytesIO
@@ -14,11 +19,19 @@ class DocumentManager:
         'text/markdown': FileType.MARKDOWN
     }
 
-    def __init__(self):
-        self.supabase = create_client(
-            os.getenv("SUPABASE_URL"),
-            os.getenv("SUPABASE_KEY")
-        )
+    # Only the columns needed to render a document listing
+    CATALOG_COLUMNS = "id,filename,upload_date,file_type,page_count,file_size"
+    CATALOG_CACHE_TTL = int(os.getenv("DOCUMENT_CACHE_TTL", "300"))
+    # Least recently used users and pages are evicted past these bounds
+    CATALOG_CACHE_USERS = int(os.getenv("DOCUMENT_CACHE_USERS", "1000"))
+    CATALOG_CACHE_PAGES_PER_USER = int(os.getenv("DOCUMENT_CACHE_PAGES_PER_USER", "16"))
+
+    def __init__(self, supabase: Client, storage):
+        # Shared clients owned by the application lifespan
+        self.supabase = supabase
+        self.storage = storage
+        # Per-user cache of listing pages: email -> {(cursor, limit): (expires_at, page)}
+        self._catalog_cache: "OrderedDict[str, OrderedDict[Tuple[Optional[str], int], Tuple[float, DocumentPage]]]" = OrderedDict()
     
     def _detect_file_type(self, content: bytes) -> FileType:
         try:
@@ -52,19 +65,77 @@ class DocumentManager:
             
         raise ValueError(f"Unsupported file type: {file_type}")
 
-    async def store_document(self, file_content: bytes, filename: str, uploader_email: str) -> Tuple[Document, str]:
-        # Generate unique ID
-        doc_id = str(uuid.uuid4())
+    async def store_document(self, file_content: bytes, filename: str, uploader_email: str) -> Tuple[Document, Optional[str]]:
+        """Store an uploaded file and return its document with the extracted text.
+
+        Uploads are keyed by the sha256 of their content. If the same content is
+        already stored, the uploader is linked to the existing file and namespace
+        and the returned text is None, since its vectors already exist.
+        New documents are stored as pending; the caller activates them with
+        set_status once their vectors are written.
+        """
+        content_hash = hashlib.sha256(file_content).hexdigest()
+        
+        duplicate = self.link_duplicate(content_hash, filename, uploader_email)
+        if duplicate:
+            return duplicate, None
         
         # Detect file type and extract text
         file_type = self._detect_file_type(file_content)
         text_content, metadata = self._extract_text(file_content, file_type)
         
-        # Store original file in Supabase Storage
-        storage_path = f"documents/{doc_id}/{filename}"
-        self.supabase.storage.from_("documents").upload(
+        document = self.save_document(
+            str(uuid.uuid4()),
+            file_content,
+            content_hash,
+            filename,
+            uploader_email,
+            file_type,
+            metadata,
+            status="pending"
+        )
+        return document, text_content
+
+    def link_duplicate(self, content_hash: str, filename: str, uploader_email: str) -> Optional[Document]:
+        """Link the uploader to already stored content, if any exists"""
+        own_copy = self._find_by_hash(content_hash, uploader_email)
+        if own_copy:
+            return own_copy
+        
+        existing = self._find_by_hash(content_hash)
+        if not existing:
+            return None
+        
+        document = existing.copy(update={
+            "id": str(uuid.uuid4()),
+            "filename": filename,
+            "uploader_email": uploader_email,
+            "upload_date": datetime.utcnow()
+        })
+        self.supabase.table("documents").insert(document.dict()).execute()
+        self._invalidate_catalog(uploader_email)
+        return document
+
+    def save_document(
+        self,
+        doc_id: str,
+        file_content: bytes,
+        content_hash: str,
+        filename: str,
+        uploader_email: str,
+        file_type: FileType,
+        metadata: dict,
+        status: str = "active",
+        namespace: Optional[str] = None
+    ) -> Document:
+        """Store the original file and its document record"""
+        # Store original file in Supabase Storage, keyed by content.
+        # Upsert so a retry after a failed upload can rewrite the same path.
+        storage_path = f"documents/{content_hash}/{filename}"
+        self.storage.from_("documents").upload(
             storage_path,
-            file_content
+            file_content,
+            {"x-upsert": "true"}
         )
         
         # Create document record
@@ -72,16 +143,51 @@ class DocumentManager:
             id=doc_id,
             filename=filename,
             uploader_email=uploader_email,
-            pinecone_namespace=doc_id,
+            pinecone_namespace=namespace or doc_id,
+            upload_date=datetime.utcnow(),
             file_type=file_type,
             file_size=len(file_content),
+            content_hash=content_hash,
+            storage_path=storage_path,
+            status=status,
             **metadata
         )
         
         # Store metadata in Supabase
         self.supabase.table("documents").insert(document.dict()).execute()
+        self._invalidate_catalog(uploader_email)
         
-        return document, text_content
+        return document
+
+    def set_status(self, document: Document, status: str):
+        """Update a document's status, e.g. activate it once its vectors exist"""
+        self.supabase.table("documents")\
+            .update({"status": status})\
+            .eq("id", document.id)\
+            .execute()
+        document.status = status
+        self._invalidate_catalog(document.uploader_email)
+
+    def discard_failed(self, document: Document):
+        """Mark a pending upload failed and remove its stored file.
+
+        The caller drops any vectors already written to its namespace.
+        """
+        self.set_status(document, "failed")
+        # An identical upload may have been activated meanwhile at the same path
+        if document.content_hash and self._find_by_hash(document.content_hash):
+            return
+        self.storage.from_("documents").remove([document.storage_path])
+
+    def get_user_document(self, doc_id: str, email: str) -> Optional[Document]:
+        """Get one of a user's active documents"""
+        response = self.supabase.table("documents")\
+            .select("*")\
+            .eq("id", doc_id)\
+            .eq("uploader_email", email)\
+            .eq("status", "active")\
+            .execute()
+        return Document(**response.data[0]) if response.data else None
 
     def get_user_documents(self, email: str) -> List[Document]:
         response = self.supabase.table("documents")\
@@ -89,4 +195,121 @@ class DocumentManager:
             .eq("uploader_email", email)\
             .eq("status", "active")\
             .execute()
-        return [Document(**doc) for doc in response.data] 
\ No newline at end of file
+        return [Document(**doc) for doc in response.data]
+
+    def delete_document(self, doc_id: str, email: str) -> Optional[Tuple[Document, bool]]:
+        """Mark a user's document deleted, removing its file once nothing references it.
+
+        Returns the deleted document and whether it was the last reference to
+        its content, in which case the caller should drop its vectors. Returns
+        None if the user has no such active document.
+        """
+        document = self.get_user_document(doc_id, email)
+        if not document:
+            return None
+        
+        self.supabase.table("documents")\
+            .update({"status": "deleted"})\
+            .eq("id", doc_id)\
+            .execute()
+        self._invalidate_catalog(email)
+        document.status = "deleted"
+        
+        # Other uploaders of the same content still need the file and vectors
+        if document.content_hash and self._find_by_hash(document.content_hash):
+            return document, False
+        
+        self.storage.from_("documents").remove(
+            [document.storage_path or f"documents/{document.id}/{document.filename}"]
+        )
+        return document, True
+
+    def _find_by_hash(self, content_hash: str, email: Optional[str] = None) -> Optional[Document]:
+        """Find an active document with the given content, optionally for one uploader"""
+        query = self.supabase.table("documents")\
+            .select("*")\
+            .eq("content_hash", content_hash)\
+            .eq("status", "active")
+        if email:
+            query = query.eq("uploader_email", email)
+        response = query.limit(1).execute()
+        return Document(**response.data[0]) if response.data else None
+
+    def list_user_documents(self, email: str, limit: int = 20, cursor: Optional[str] = None) -> DocumentPage:
+        """List a user's documents, newest first, using keyset pagination.
+
+        Pages are served from a per-user read-through cache that is dropped
+        whenever the user's documents change.
+        """
+        user_cache = self._catalog_cache.get(email)
+        cached = user_cache.get((cursor, limit)) if user_cache else None
+        if cached and cached[0] > time.monotonic():
+            self._catalog_cache.move_to_end(email)
+            user_cache.move_to_end((cursor, limit))
+            return cached[1]
+        
+        query = self.supabase.table("documents")\
+            .select(self.CATALOG_COLUMNS)\
+            .eq("uploader_email", email)\
+            .eq("status", "active")
+        
+        if cursor:
+            upload_date, doc_id = self._decode_cursor(cursor)
+            query = query.or_(
+                f"upload_date.lt.{upload_date},"
+                f"and(upload_date.eq.{upload_date},id.lt.{doc_id})"
+            )
+        
+        # Fetch one extra row to know whether another page exists
+        response = query\
+            .order("upload_date", desc=True)\
+            .order("id", desc=True)\
+            .limit(limit + 1)\
+            .execute()
+        
+        rows = response.data[:limit]
+        documents = [DocumentSummary(**row) for row in rows]
+        next_cursor = None
+        if len(response.data) > limit and documents:
+            last = documents[-1]
+            next_cursor = self._encode_cursor(last.upload_date, last.id)
+        
+        page = DocumentPage(documents=documents, next_cursor=next_cursor)
+        self._cache_page(email, (cursor, limit), page)
+        return page
+
+    def _cache_page(self, email: str, key: Tuple[Optional[str], int], page: DocumentPage):
+        now = time.monotonic()
+        user_cache = self._catalog_cache.get(email)
+        if user_cache is None:
+            user_cache = self._catalog_cache[email] = OrderedDict()
+        else:
+            # Drop the user's expired pages while we are here
+            for stale in [k for k, (expires_at, _) in user_cache.items() if expires_at <= now]:
+                del user_cache[stale]
+            self._catalog_cache.move_to_end(email)
+
+        user_cache[key] = (now + self.CATALOG_CACHE_TTL, page)
+        user_cache.move_to_end(key)
+        while len(user_cache) > self.CATALOG_CACHE_PAGES_PER_USER:
+            user_cache.popitem(last=False)
+        while len(self._catalog_cache) > self.CATALOG_CACHE_USERS:
+            self._catalog_cache.popitem(last=False)
+
+    def _invalidate_catalog(self, email: str):
+        self._catalog_cache.pop(email, None)
+
+    @staticmethod
+    def _encode_cursor(upload_date: datetime, doc_id: str) -> str:
+        raw = f"{upload_date.isoformat()}|{doc_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[str, str]:
+        try:
+            upload_date, doc_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+            datetime.fromisoformat(upload_date)
+            uuid.UUID(doc_id)
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        return upload_date, doc_id
@@ -0,0 +1,243 @@
+"""Bulk-ingest a directory of documents into Supabase and Pinecone.
+
+Usage (from the backend directory):
+    python ingest.py ./corpus --uploader admin@example.com
+
+Extraction runs in a process pool, chunks from many documents are embedded
+together in large batches, and finished documents are appended to a
+checkpoint file so an interrupted run picks up where it left off.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Set
+
+from dotenv import load_dotenv
+
+# Local modules read their settings at import, so load .env first
+load_dotenv()
+
+from clients import ServiceClients
+from document_manager import DocumentManager
+from llm_config import LLMProvider, get_embeddings
+from utils import get_text_splitter
+
+# Pinecone accepts at most this many vectors per upsert request
+UPSERT_BATCH_SIZE = 100
+
+class ExtractedDocument:
+    __slots__ = ("path", "content_hash", "file_type", "text", "metadata", "error", "content")
+
+    def __init__(self, path, content_hash, file_type=None, text=None, metadata=None, error=None):
+        self.path = path
+        self.content_hash = content_hash
+        self.file_type = file_type
+        self.text = text
+        self.metadata = metadata
+        self.error = error
+        # The raw bytes stay with the parent process, which read them
+        self.content = None
+
+def extract_file(path: str, content: bytes, content_hash: str) -> ExtractedDocument:
+    """Type-check and extract one file; runs in a worker process"""
+    # Extraction needs no service clients
+    extractor = DocumentManager(None, None)
+    try:
+        file_type = extractor._detect_file_type(content)
+        text, metadata = extractor._extract_text(content, file_type)
+    except Exception as e:
+        # Corrupt files (e.g. pypdf read errors) must not abort the whole run
+        return ExtractedDocument(path, content_hash, error=f"{type(e).__name__}: {e}")
+    return ExtractedDocument(path, content_hash, file_type, text, metadata)
+
+def namespace_for(content_hash: str) -> str:
+    # Derived from the content so a resumed run writes to the same namespace
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"sha256:{content_hash}"))
+
+class Checkpoint:
+    """Append-only record of finished files, keyed by path and content hash"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.done: Set[str] = set()
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A run killed mid-write can leave a partial last line
+                        continue
+                    self.done.add(self._key(entry["path"], entry["sha256"]))
+        self._file = open(self.path, "a")
+
+    @staticmethod
+    def _key(path: str, content_hash: str) -> str:
+        return f"{path}:{content_hash}"
+
+    def is_done(self, path: str, content_hash: str) -> bool:
+        return self._key(path, content_hash) in self.done
+
+    def mark_done(self, path: str, content_hash: str, document_id: Optional[str]):
+        self._file.write(json.dumps({"path": path, "sha256": content_hash, "document_id": document_id}) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done.add(self._key(path, content_hash))
+
+    def close(self):
+        self._file.close()
+
+class Ingester:
+    def __init__(self, clients: ServiceClients, embeddings, uploader: str, checkpoint: Checkpoint, batch_size: int):
+        self.manager = DocumentManager(clients.supabase, clients.storage)
+        self.index = clients.pinecone_index
+        self.embeddings = embeddings
+        self.uploader = uploader
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.splitter = get_text_splitter()
+        self.pending: List[tuple] = []  # (ExtractedDocument, chunks)
+        self.pending_chunks = 0
+        self.ingested = 0
+        self.linked = 0
+        self.failed = 0
+
+    def add(self, doc: ExtractedDocument):
+        if doc.error:
+            print(f"Skipping {doc.path}: {doc.error}")
+            self.failed += 1
+            return
+
+        # Identical files in one run: store the first before linking the rest
+        if any(pending.content_hash == doc.content_hash for pending, _ in self.pending):
+            self.flush()
+
+        filename = Path(doc.path).name
+        duplicate = self.manager.link_duplicate(doc.content_hash, filename, self.uploader)
+        if duplicate:
+            self.checkpoint.mark_done(doc.path, doc.content_hash, duplicate.id)
+            self.linked += 1
+            return
+
+        chunks = self.splitter.split_text(doc.text)
+        self.pending.append((doc, chunks))
+        self.pending_chunks += len(chunks)
+        if self.pending_chunks >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Embed all pending chunks in one call, then record the finished documents"""
+        if not self.pending:
+            return
+
+        texts = [chunk for _, chunks in self.pending for chunk in chunks]
+        vectors = iter(self.embeddings.embed_documents(texts))
+
+        for doc, chunks in self.pending:
+            namespace = namespace_for(doc.content_hash)
+            records = [
+                (f"{namespace}-{i}", next(vectors), {"text": chunk})
+                for i, chunk in enumerate(chunks)
+            ]
+            for start in range(0, len(records), UPSERT_BATCH_SIZE):
+                self.index.upsert(vectors=records[start:start + UPSERT_BATCH_SIZE], namespace=namespace)
+
+            # The record is written last, so a document only counts once its vectors exist
+            # The row id is fresh: soft-deleted rows may still hold an earlier id
+            document = self.manager.save_document(
+                str(uuid.uuid4()),
+                doc.content,
+                doc.content_hash,
+                Path(doc.path).name,
+                self.uploader,
+                doc.file_type,
+                doc.metadata,
+                namespace=namespace
+            )
+            self.checkpoint.mark_done(doc.path, doc.content_hash, document.id)
+            self.ingested += 1
+
+        self.pending = []
+        self.pending_chunks = 0
+
+def find_files(root: str) -> List[str]:
+    return sorted(
+        str(path) for path in Path(root).rglob("*")
+        if path.is_file() and not any(part.startswith(".") for part in path.relative_to(root).parts)
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest documents into the vector store")
+    parser.add_argument("directory", help="Directory tree to ingest")
+    parser.add_argument("--uploader", required=True, help="Email recorded as the uploader")
+    parser.add_argument("--checkpoint", default="data/ingest_checkpoint.jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=512, help="Chunks per embedding call")
+    parser.add_argument("--window", type=int, default=None, help="Files in flight at once (default: 4 per worker)")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.checkpoint) or ".", exist_ok=True)
+    checkpoint = Checkpoint(args.checkpoint)
+    files = find_files(args.directory)
+    print(f"{len(files)} files found ({len(checkpoint.done)} already done)")
+
+    provider = LLMProvider(os.getenv("LLM_PROVIDER", "mistral").split('#')[0].strip())
+    clients = ServiceClients()
+    clients.open()
+    ingester = Ingester(clients, get_embeddings(provider), args.uploader, checkpoint, args.batch_size)
+
+    workers = args.workers or os.cpu_count() or 1
+    window_size = args.window or workers * 4
+    start = time.perf_counter()
+    extracted = resumed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # A bounded window of submitted files, so finished extractions
+            # never pile up in memory when embedding is the slower side
+            window = deque()
+
+            def drain_one():
+                nonlocal extracted
+                future, content = window.popleft()
+                doc = future.result()
+                doc.content = content
+                ingester.add(doc)
+                extracted += 1
+                if extracted % 100 == 0:
+                    elapsed = time.perf_counter() - start
+                    print(f"{extracted} extracted, {extracted / elapsed:.1f} docs/s")
+
+            for path in files:
+                # Each file is read once; the bytes are hashed for the resume
+                # check, sent to a worker for extraction and kept for storage
+                content = Path(path).read_bytes()
+                content_hash = hashlib.sha256(content).hexdigest()
+                if checkpoint.is_done(path, content_hash):
+                    resumed += 1
+                    continue
+                window.append((pool.submit(extract_file, path, content, content_hash), content))
+                if len(window) >= window_size:
+                    drain_one()
+            while window:
+                drain_one()
+        ingester.flush()
+    finally:
+        checkpoint.close()
+        clients.close()
+
+    elapsed = time.perf_counter() - start
+    processed = ingester.ingested + ingester.linked
+    print(
+        f"Ingested {ingester.ingested}, linked {ingester.linked} duplicates, "
+        f"skipped {ingester.failed}, resumed past {resumed} in {elapsed:.1f}s "
+        f"({processed / elapsed if elapsed else 0:.1f} docs/s)"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -29,16 +29,35 @@ def get_llm(provider: LLMProvider):
     else:
         raise ValueError(f"Unknown provider: {provider}")
 
-def get_embeddings(provider: LLMProvider):
-    if provider in [LLMProvider.MISTRAL, LLMProvider.DEEPSEEK, LLMProvider.GROQ]:
-        return HuggingFaceEmbeddings(
+def _sentence_transformer_embeddings():
+    # EMBEDDING_BACKEND=onnx serves the same model through int8 ONNX Runtime on CPU
+    if os.getenv("EMBEDDING_BACKEND", "torch").split('#')[0].strip() == "onnx":
+        from onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings(
             model_name="sentence-transformers/all-mpnet-base-v2"
         )
+    return HuggingFaceEmbeddings(
+        model_name="sentence-transformers/all-mpnet-base-v2"
+    )
+
+def get_embeddings(provider: LLMProvider):
+    if provider in [LLMProvider.MISTRAL, LLMProvider.DEEPSEEK, LLMProvider.GROQ]:
+        return _sentence_transformer_embeddings()
     elif provider == LLMProvider.COHERE:
         return CohereEmbeddings(
             api_key=os.getenv("COHERE_API_KEY")
         )
     else:
-        return HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-mpnet-base-v2"
-        ) 
\ No newline at end of file
+        return _sentence_transformer_embeddings() 
+
+def embed_queries(embeddings, texts):
+    """Embed many queries in one call, encoded exactly as embed_query would encode each"""
+    if isinstance(embeddings, CohereEmbeddings):
+        # Cohere embeds queries and documents differently
+        return embeddings.embed(texts, input_type="search_query")
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    if isinstance(embeddings, HuggingFaceEmbeddings):
+        # Sentence-transformers encode queries and documents the same way
+        return embeddings.embed_documents(texts)
+    return [embeddings.embed_query(text) for text in texts]
\ No newline at end of file
@@ -1,9 +1,15 @@
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, status
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Query, Request, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
 from datetime import timedelta
 from typing import List
+import asyncio
+import logging
 import os
+import pinecone
 
 # Local imports
 from auth import (
@@ -14,17 +20,28 @@ from auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from models import User
-from models.chat import ChatSession, Message
-from utils import process_uploaded_file, query_chatbot
+from models.chat import ChatSession, ChatSessionSummary, Message, BatchQueryRequest, MessageSearchResult
+from utils import (
+    process_uploaded_file,
+    query_chatbot,
+    summarize_messages,
+    delete_namespace,
+    store_texts,
+    get_text_splitter,
+    run_batch_queries,
+    CHAT_HISTORY_TURNS
+)
 from session_manager import SessionManager
 from llm_config import LLMProvider, get_embeddings
 from models.user import UserCreate, UserRole
+from models.document import DocumentPage
 from user_manager import UserManager
 from document_manager import DocumentManager
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores import Pinecone
+from clients import ServiceClients
+from admission import AdmissionController
+
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
 session_manager = SessionManager()
 
 # Create embeddings and store in Pinecone
@@ -35,8 +52,55 @@ embeddings = get_embeddings(current_provider)
 # Initialize user manager
 user_manager = UserManager()
 
-# Initialize document manager
-document_manager = DocumentManager()
+# Per-route (concurrency, max queued) limits
+admission = AdmissionController({
+    "chat": (
+        int(os.getenv("CHAT_CONCURRENCY", "8")),
+        int(os.getenv("CHAT_QUEUE_SIZE", "32"))
+    ),
+    "upload": (
+        int(os.getenv("UPLOAD_CONCURRENCY", "2")),
+        int(os.getenv("UPLOAD_QUEUE_SIZE", "8"))
+    ),
+    "batch": (
+        int(os.getenv("BATCH_CONCURRENCY", "2")),
+        int(os.getenv("BATCH_QUEUE_SIZE", "4"))
+    )
+})
+
+# How often idle sessions are checked for archival, in seconds
+ARCHIVE_INTERVAL = int(os.getenv("SESSION_ARCHIVE_INTERVAL", "600"))
+
+async def archive_sessions_periodically():
+    while True:
+        try:
+            session_manager.archive_idle_sessions()
+        except Exception:
+            # One failed pass (e.g. a full disk) must not end archival for good
+            logger.exception("Session archival failed")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared, pooled clients for Supabase and Pinecone
+    clients = ServiceClients()
+    clients.open()
+    app.state.clients = clients
+    app.state.document_manager = DocumentManager(clients.supabase, clients.storage)
+    archiver_task = asyncio.create_task(archive_sessions_periodically())
+    
+    yield
+    
+    archiver_task.cancel()
+    clients.close()
+
+app = FastAPI(lifespan=lifespan)
+
+def get_document_manager(request: Request) -> DocumentManager:
+    return request.app.state.document_manager
+
+def get_pinecone_index(request: Request) -> pinecone.Index:
+    return request.app.state.clients.pinecone_index
 
 # CORS middleware configuration
 app.add_middleware(
@@ -47,10 +111,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def conditional_response(request: Request, etag: str, build) -> Response:
+    """Answer 304 if the client already has this version, else build the body"""
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return ORJSONResponse(content=build(), headers={"ETag": etag})
+
 @app.post("/upload/")
 async def upload_file(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(admission.admit("upload")),
+    document_manager: DocumentManager = Depends(get_document_manager),
+    index: pinecone.Index = Depends(get_pinecone_index)
 ):
     # Read file content
     content = await file.read()
@@ -63,18 +135,23 @@ async def upload_file(
             current_user.email
         )
         
-        # Process for RAG
-        text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        texts = text_splitter.split_text(text_content)
-        
-        # Store in Pinecone with document namespace
-        embeddings = get_embeddings(current_provider)
-        Pinecone.from_texts(
-            texts,
-            embeddings,
-            index_name=os.getenv("PINECONE_INDEX_NAME"),
-            namespace=document.id
-        )
+        # Duplicate content already has vectors in its shared namespace
+        if text_content is not None:
+            # The document only becomes active, and so visible to dedup,
+            # once its vectors exist
+            try:
+                # Process for RAG
+                text_splitter = get_text_splitter()
+                texts = text_splitter.split_text(text_content)
+                
+                # Store in Pinecone with document namespace
+                store_texts(index, texts, embeddings, document.pinecone_namespace)
+            except Exception:
+                # Leave nothing behind for an upload that never became active
+                document_manager.discard_failed(document)
+                delete_namespace(index, document.pinecone_namespace)
+                raise
+            document_manager.set_status(document, "active")
         
         return {
             "message": "File uploaded and processed successfully",
@@ -87,20 +164,77 @@ async def upload_file(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/chat/session")
+@app.get("/documents")
+async def list_documents(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    current_user: User = Depends(get_current_user),
+    document_manager: DocumentManager = Depends(get_document_manager)
+) -> DocumentPage:
+    """List the current user's documents, newest first"""
+    try:
+        return document_manager.list_user_documents(current_user.email, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/documents/{document_id}")
+async def delete_document(
+    document_id: str,
+    current_user: User = Depends(get_current_user),
+    document_manager: DocumentManager = Depends(get_document_manager),
+    index: pinecone.Index = Depends(get_pinecone_index)
+) -> dict:
+    """Delete a document along with its stored file and vectors"""
+    result = document_manager.delete_document(document_id, current_user.email)
+    if not result:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    document, last_reference = result
+    if last_reference:
+        delete_namespace(index, document.pinecone_namespace)
+    return {"message": "Document deleted successfully"}
+
+@app.post("/chat/session", response_model=ChatSession)
 async def create_chat_session(
     document_id: str = None,
     user: User = Depends(get_current_user)
-) -> ChatSession:
+):
     """Create a new chat session"""
-    return session_manager.create_session(user["username"], document_id)
+    session = session_manager.create_session(user.email, document_id)
+    return ORJSONResponse(content=session.to_dict())
 
-@app.get("/chat/sessions")
+@app.get("/chat/sessions", response_model=List[ChatSession])
 async def get_user_sessions(
+    request: Request,
     user: User = Depends(get_current_user)
-) -> List[ChatSession]:
+):
     """Get all chat sessions for the current user"""
-    return session_manager.get_user_sessions(user["username"])
+    return conditional_response(
+        request,
+        session_manager.get_user_etag(user.email),
+        lambda: [s.to_dict() for s in session_manager.get_user_sessions(user.email)]
+    )
+
+@app.get("/chat/sessions/summary", response_model=List[ChatSessionSummary])
+async def get_user_session_summaries(
+    request: Request,
+    user: User = Depends(get_current_user)
+):
+    """Get session ids and timestamps for the current user, without messages"""
+    return conditional_response(
+        request,
+        session_manager.get_user_etag(user.email),
+        lambda: session_manager.get_user_session_summaries(user.email)
+    )
+
+@app.get("/chat/search", response_model=List[MessageSearchResult])
+async def search_chat_history(
+    q: str,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+):
+    """Search the current user's chat history for messages containing every word of q"""
+    return ORJSONResponse(content=session_manager.search_messages(current_user.email, q, limit))
 
 @app.delete("/chat/session/{session_id}")
 async def delete_chat_session(
@@ -108,27 +242,90 @@ async def delete_chat_session(
     user: User = Depends(get_current_user)
 ) -> dict:
     """Delete a chat session"""
-    if session_manager.delete_session(session_id, user["username"]):
+    if session_manager.delete_session(session_id, user.email):
         return {"message": "Session deleted successfully"}
     raise HTTPException(status_code=404, detail="Session not found")
 
+@app.post("/chat/batch")
+async def chat_batch(
+    request: BatchQueryRequest,
+    current_user: User = Depends(get_current_user),
+    document_manager: DocumentManager = Depends(get_document_manager),
+    index: pinecone.Index = Depends(get_pinecone_index)
+):
+    """Answer a list of queries against one of the current user's documents.
+
+    Results are streamed as newline-delimited JSON in completion order,
+    each tagged with the index of its query and per-item timings.
+    """
+    document = document_manager.get_user_document(request.document_id, current_user.email)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    # Charged per query, and the slot is held until the stream finishes.
+    # The background task also releases it if the stream never starts.
+    release = await admission.hold("batch", current_user, cost=len(request.queries))
+    
+    async def stream():
+        try:
+            async for line in run_batch_queries(
+                request.queries,
+                index,
+                document.pinecone_namespace,
+                embeddings,
+                current_provider,
+                top_k=request.top_k
+            ):
+                yield line
+        finally:
+            release()
+    
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(release)
+    )
+
 @app.post("/chat/{session_id}")
 async def chat(
     session_id: str,
     query: str,
-    user: User = Depends(get_current_user)
+    user: User = Depends(admission.admit("chat")),
+    document_manager: DocumentManager = Depends(get_document_manager),
+    index: pinecone.Index = Depends(get_pinecone_index)
 ):
     """Send a message in a specific chat session"""
     session = session_manager.get_session(session_id)
-    if not session or session.user_id != user["username"]:
+    if not session or session.user_id != user.email:
         raise HTTPException(status_code=404, detail="Session not found")
     
+    # Answers come from the document the session was opened on
+    if not session.document_id:
+        raise HTTPException(status_code=400, detail="Session has no document")
+    document = document_manager.get_user_document(session.document_id, user.email)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
     # Add user message to history
+    position = len(session.messages)
     session_manager.add_message(session_id, query, "user")
     
     try:
-        # Get chatbot response using the configured LLM provider
-        response = query_chatbot(query)
+        # Conversation memory covers the history before the new query
+        summary, recent = await session_manager.get_conversation_context(
+            session_id, CHAT_HISTORY_TURNS, summarize_messages, position
+        )
+        
+        # Get chatbot response using the configured LLM provider, off the event loop
+        response = await asyncio.to_thread(
+            query_chatbot,
+            query,
+            index,
+            document.pinecone_namespace,
+            embeddings,
+            summary=summary,
+            history=recent
+        )
         
         # Add assistant response to history
         session_manager.add_message(session_id, response["response"], "assistant")
@@ -139,17 +336,35 @@ async def chat(
         session_manager.add_message(session_id, error_msg, "system")
         raise HTTPException(status_code=500, detail=error_msg)
 
-@app.get("/chat/{session_id}/history")
+@app.get("/chat/{session_id}/history", response_model=List[Message])
 async def get_chat_history(
     session_id: str,
+    request: Request,
     user: User = Depends(get_current_user)
-) -> List[Message]:
+):
     """Get chat history for a specific session"""
     session = session_manager.get_session(session_id)
-    if not session or session.user_id != user["username"]:
+    if not session or session.user_id != user.email:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return session.messages
+    return conditional_response(
+        request,
+        session_manager.get_history_etag(session),
+        lambda: [m.to_dict() for m in session.messages]
+    )
+
+@app.get("/health")
+async def health(request: Request) -> dict:
+    """Liveness probe with connection pool utilization"""
+    return {
+        "status": "ok",
+        "pools": request.app.state.clients.pool_stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> str:
+    """Admission queue depths and rejection counters"""
+    return admission.metrics()
 
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -1,10 +1,13 @@
-from .chat import Message, ChatSession, ChatHistory
+from .chat import Message, ChatSession, ChatSessionSummary, ChatHistory, BatchQueryRequest, MessageSearchResult
 from .base import User, Token, Query
 
 __all__ = [
     'Message',
     'ChatSession',
+    'ChatSessionSummary',
     'ChatHistory',
+    'BatchQueryRequest',
+    'MessageSearchResult',
     'User',
     'Token',
     'Query'
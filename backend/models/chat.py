@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, conlist
 from typing import List, Optional
 from datetime import datetime
 
@@ -14,6 +14,30 @@ class ChatSession(BaseModel):
     created_at: datetime
     last_updated: datetime
     document_id: Optional[str] = None  # Reference to the document being queried
+    summary: Optional[str] = None  # Rolling summary of turns older than the recent window
+    summarized_count: int = 0  # Number of messages already folded into the summary
+    
+class ChatSessionSummary(BaseModel):
+    session_id: str
+    created_at: datetime
+    last_updated: datetime
+    document_id: Optional[str] = None
+    message_count: int
+    
+class MessageSearchResult(BaseModel):
+    session_id: str
+    position: int  # Index of the message within the session history
+    content: str
+    timestamp: datetime
+    role: str
     
 class ChatHistory(BaseModel):
-    sessions: List[ChatSession] 
\ No newline at end of file
+    sessions: List[ChatSession] 
+    
+# Upper bound on queries per batch call, since each one costs an LLM call
+MAX_BATCH_QUERIES = 200
+
+class BatchQueryRequest(BaseModel):
+    document_id: str  # One of the caller's active documents
+    queries: conlist(str, min_items=1, max_items=MAX_BATCH_QUERIES)
+    top_k: int = Field(4, ge=1, le=20)
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from enum import Enum
 
 class FileType(str, Enum):
@@ -13,8 +13,22 @@ class Document(BaseModel):
     filename: str
     uploader_email: str
     pinecone_namespace: Optional[str] = None
-    upload_date: datetime = datetime.utcnow()
+    upload_date: datetime = Field(default_factory=datetime.utcnow)
     file_type: FileType
     status: str = "active"
     page_count: Optional[int] = None
-    file_size: Optional[int] = None 
\ No newline at end of file
+    file_size: Optional[int] = None 
+    content_hash: Optional[str] = None  # sha256 of the file, shared by duplicate uploads
+    storage_path: Optional[str] = None
+
+class DocumentSummary(BaseModel):
+    id: str
+    filename: str
+    upload_date: datetime
+    file_type: FileType
+    page_count: Optional[int] = None
+    file_size: Optional[int] = None
+
+class DocumentPage(BaseModel):
+    documents: List[DocumentSummary]
+    next_cursor: Optional[str] = None  # Pass back to fetch the following page
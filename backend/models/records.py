@@ -0,0 +1,120 @@
+"""Compact in-memory records for chat sessions.
+
+The Pydantic models in models.chat describe the API; these slotted records
+are what SessionManager keeps resident and persists. Messages are written
+column-wise so the field names are stored once per session, not per message.
+"""
+import sys
+from datetime import datetime
+from typing import List, Optional
+
+import orjson
+
+def parse_datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+class MessageRecord:
+    __slots__ = ("content", "timestamp", "role")
+
+    def __init__(self, content: str, timestamp: datetime, role: str):
+        self.content = content
+        self.timestamp = timestamp
+        # Roles repeat on every message, so share one string object per role
+        self.role = sys.intern(role)
+
+    def to_dict(self) -> dict:
+        return {"content": self.content, "timestamp": self.timestamp, "role": self.role}
+
+class SessionRecord:
+    __slots__ = (
+        "session_id",
+        "user_id",
+        "messages",
+        "created_at",
+        "last_updated",
+        "document_id",
+        "summary",
+        "summarized_count"
+    )
+
+    def __init__(
+        self,
+        session_id: str,
+        user_id: str,
+        messages: List[MessageRecord],
+        created_at: datetime,
+        last_updated: datetime,
+        document_id: Optional[str] = None,
+        summary: Optional[str] = None,
+        summarized_count: int = 0
+    ):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.messages = messages
+        self.created_at = created_at
+        self.last_updated = last_updated
+        self.document_id = document_id
+        self.summary = summary
+        self.summarized_count = summarized_count
+
+    def to_dict(self) -> dict:
+        """Response shape, matching models.chat.ChatSession"""
+        return {
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "messages": [m.to_dict() for m in self.messages],
+            "created_at": self.created_at,
+            "last_updated": self.last_updated,
+            "document_id": self.document_id,
+            "summary": self.summary,
+            "summarized_count": self.summarized_count
+        }
+
+    def to_storage(self) -> dict:
+        """Storage shape, with messages stored as columns"""
+        return {
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "messages": {
+                "content": [m.content for m in self.messages],
+                "timestamp": [m.timestamp for m in self.messages],
+                "role": [m.role for m in self.messages]
+            },
+            "created_at": self.created_at,
+            "last_updated": self.last_updated,
+            "document_id": self.document_id,
+            "summary": self.summary,
+            "summarized_count": self.summarized_count
+        }
+
+    @classmethod
+    def from_storage(cls, data: dict) -> "SessionRecord":
+        messages = data.get("messages") or []
+        if isinstance(messages, dict):
+            rows = zip(messages["content"], messages["timestamp"], messages["role"])
+        else:
+            # Sessions saved before the columnar format store one dict per message
+            rows = ((m["content"], m["timestamp"], m["role"]) for m in messages)
+
+        return cls(
+            session_id=data["session_id"],
+            user_id=data["user_id"],
+            messages=[
+                MessageRecord(content, parse_datetime(timestamp), role)
+                for content, timestamp, role in rows
+            ],
+            created_at=parse_datetime(data["created_at"]),
+            last_updated=parse_datetime(data["last_updated"]),
+            document_id=data.get("document_id"),
+            summary=data.get("summary"),
+            summarized_count=data.get("summarized_count", 0)
+        )
+
+def dumps(data) -> bytes:
+    """Serialize records (or plain data containing datetimes) with orjson"""
+    return orjson.dumps(data)
+
+def loads(data: bytes):
+    return orjson.loads(data)
@@ -0,0 +1,200 @@
+"""Int8 ONNX Runtime serving for sentence-transformer embeddings.
+
+Compare a quantized model against the full-precision one (from the backend
+directory):
+    python onnx_embeddings.py --texts samples.txt
+"""
+import argparse
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+
+def export_quantized_model(model_name: str, output_dir: str) -> Path:
+    """Export a sentence-transformer to ONNX and quantize its weights to int8"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    fp32_path = output_path / "model.onnx"
+    int8_path = output_path / QUANTIZED_MODEL_FILE
+
+    class TokenEmbeddings(torch.nn.Module):
+        """Expose only the token embeddings, so the graph carries no pooler"""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = TokenEmbeddings(AutoModel.from_pretrained(model_name))
+    model.eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        str(fp32_path),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "last_hidden_state": {0: "batch", 1: "sequence"}
+        },
+        opset_version=14
+    )
+    quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(str(output_path))
+    fp32_path.unlink()
+    return int8_path
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence-transformer embeddings served by an int8 ONNX Runtime model.
+
+    Texts are sorted by token length and grouped into batches bounded by a
+    token budget, so each batch pads to a similar length and short inputs
+    are packed into larger batches than long ones.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        model_dir: Optional[str] = None,
+        num_threads: Optional[int] = None,
+        max_batch_tokens: int = 8192,
+        max_length: int = 384
+    ):
+        try:
+            import onnx  # noqa: F401  (needed to export and quantize on first use)
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError:
+            raise ImportError(
+                "The ONNX embedding backend requires onnxruntime and onnx. "
+                "Install them with `pip install onnxruntime onnx`."
+            )
+
+        self.model_name = model_name
+        self.model_dir = Path(model_dir or os.getenv("ONNX_MODEL_DIR", "data/onnx"))
+        self.max_batch_tokens = max_batch_tokens
+        self.max_length = max_length
+
+        model_path = self.model_dir / QUANTIZED_MODEL_FILE
+        if not model_path.exists():
+            model_path = export_quantized_model(model_name, str(self.model_dir))
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads or int(os.getenv("ONNX_NUM_THREADS", "0"))
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.model_dir))
+
+    def _tokenize(self, texts: List[str]) -> List[List[int]]:
+        return self.tokenizer(texts, truncation=True, max_length=self.max_length)["input_ids"]
+
+    def _batches(self, lengths: List[int]) -> List[List[int]]:
+        """Group text indices into length-bucketed batches under the token budget"""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+
+        batches, current = [], []
+        for i in order:
+            # Padding makes a batch cost len(batch) * longest sequence
+            if current and (len(current) + 1) * lengths[i] > self.max_batch_tokens:
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _encode(self, sequences: List[List[int]]) -> np.ndarray:
+        """Embed already tokenized sequences, right-padding them to the longest"""
+        longest = max(len(ids) for ids in sequences)
+        input_ids = np.full((len(sequences), longest), self.tokenizer.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(sequences), longest), dtype=np.int64)
+        for row, ids in enumerate(sequences):
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+
+        (hidden,) = self.session.run(
+            ["last_hidden_state"],
+            {"input_ids": input_ids, "attention_mask": attention_mask}
+        )
+        # Mean pooling over real tokens, then L2 normalization as in all-mpnet-base-v2
+        mask = attention_mask[..., None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Tokenize once; the lengths drive bucketing and the ids are reused to encode
+        sequences = self._tokenize(texts)
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for batch in self._batches([len(ids) for ids in sequences]):
+            encoded = self._encode([sequences[i] for i in batch])
+            for i, vector in zip(batch, encoded):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode(self._tokenize([text]))[0].tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Queries are encoded like documents, so they share the bucketed path
+        return self.embed_documents(texts)
+
+    def check_accuracy(self, texts: List[str], reference: Optional[Embeddings] = None) -> dict:
+        """Compare these embeddings with the full-precision PyTorch model.
+
+        Returns the mean and minimum cosine similarity between matching vectors.
+        """
+        if reference is None:
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+            reference = HuggingFaceEmbeddings(model_name=self.model_name)
+
+        expected = np.array(reference.embed_documents(texts))
+        actual = np.array(self.embed_documents(texts))
+        expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+        similarity = (expected * actual).sum(axis=1)
+        return {
+            "mean_cosine": float(similarity.mean()),
+            "min_cosine": float(similarity.min())
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Check int8 ONNX embeddings against the full-precision model")
+    parser.add_argument("--texts", help="File with one sample text per line")
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--model-dir", default=None, help="Exported model directory (exported if missing)")
+    args = parser.parse_args()
+
+    if args.texts:
+        with open(args.texts) as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = [
+            "How do I reset my password?",
+            "The quarterly report shows revenue growth in every region.",
+            "Embeddings map text to vectors so similar meanings land close together."
+        ]
+
+    embeddings = OnnxEmbeddings(model_name=args.model, model_dir=args.model_dir)
+    result = embeddings.check_accuracy(texts)
+    print(f"mean cosine {result['mean_cosine']:.4f}, min cosine {result['min_cosine']:.4f} over {len(texts)} texts")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import bisect
+import hashlib
+import os
+import re
+import shutil
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from models.records import dumps, loads
+
+SEARCH_DIR = 'data/search'
+# Written once the initial backfill finishes; without it the index is rebuilt
+READY_MARKER = 'READY'
+# Rewrite a user's snapshot once this many entries have been appended to its log
+COMPACT_AFTER = int(os.getenv("SEARCH_COMPACT_AFTER", "500"))
+# Users whose postings stay loaded; the least recently searched are dropped
+MAX_PARTITIONS = int(os.getenv("SEARCH_MAX_USERS", "256"))
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text: str) -> Set[str]:
+    return {token for token in TOKEN_RE.findall(text.lower()) if len(token) > 1}
+
+def _delta_encode(values: Iterable[int]) -> List[int]:
+    previous, encoded = 0, []
+    for value in values:
+        encoded.append(value - previous)
+        previous = value
+    return encoded
+
+def _delta_decode(values: Iterable[int]) -> array:
+    total, decoded = 0, array('Q')
+    for value in values:
+        total += value
+        decoded.append(total)
+    return decoded
+
+def _contains(postings: array, value: int) -> bool:
+    i = bisect.bisect_left(postings, value)
+    return i < len(postings) and postings[i] == value
+
+class UserIndex:
+    """Inverted index over one user's messages.
+
+    A posting packs (session number, message position) into one integer, so
+    each term maps to a sorted array of 64-bit ints. On disk the postings are
+    delta-encoded in a snapshot, and new messages go to an append-only log.
+    Each compaction starts a new log generation, which the snapshot records,
+    so a crash between writing the snapshot and removing the old log never
+    replays entries the snapshot already holds.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.generation = 0
+        self.session_ids: List[str] = []
+        self.session_numbers: Dict[str, int] = {}
+        self.deleted: Set[int] = set()
+        self.postings: Dict[str, array] = {}
+        self.log_entries = 0
+        self._load()
+
+    @property
+    def log_path(self) -> str:
+        return f"{self.path}.{self.generation}.log"
+
+    @staticmethod
+    def _pack(session_number: int, position: int) -> int:
+        return (session_number << 32) | position
+
+    def _session_number(self, session_id: str) -> int:
+        number = self.session_numbers.get(session_id)
+        if number is None:
+            number = self.session_numbers[session_id] = len(self.session_ids)
+            self.session_ids.append(session_id)
+        return number
+
+    def _index(self, session_id: str, position: int, terms: Iterable[str]):
+        posting = self._pack(self._session_number(session_id), position)
+        for term in terms:
+            # Keep postings sorted so other terms can be probed by binary search
+            bisect.insort(self.postings.setdefault(term, array('Q')), posting)
+
+    def add(self, session_id: str, position: int, content: str):
+        terms = sorted(tokenize(content))
+        if not terms:
+            return
+        self._index(session_id, position, terms)
+        self._append_log({"s": session_id, "p": position, "t": terms})
+
+    def remove_session(self, session_id: str):
+        number = self.session_numbers.get(session_id)
+        if number is None:
+            return
+        self.deleted.add(number)
+        self._append_log({"d": session_id})
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, int]]:
+        """Return (session_id, message position) pairs containing every query term.
+
+        Only the rarest term's postings are scanned; the others are probed by
+        binary search, and the scan stops once enough results are found.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        lists = sorted((self.postings.get(term) for term in terms), key=lambda p: len(p) if p else 0)
+        if not lists[0]:
+            return []
+
+        # Later sessions have higher numbers, so scan from the end
+        results = []
+        for posting in reversed(lists[0]):
+            session_number = posting >> 32
+            if session_number in self.deleted:
+                continue
+            if all(_contains(other, posting) for other in lists[1:]):
+                results.append((self.session_ids[session_number], posting & 0xFFFFFFFF))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def _append_log(self, entry: dict):
+        with open(self.log_path, 'ab') as f:
+            f.write(dumps(entry) + b'\n')
+        self.log_entries += 1
+        if self.log_entries >= COMPACT_AFTER:
+            self.compact()
+
+    def compact(self):
+        """Fold the log into a fresh snapshot, dropping deleted sessions"""
+        live = [n for n in range(len(self.session_ids)) if n not in self.deleted]
+        renumber = {old: new for new, old in enumerate(live)}
+        postings = {}
+        for term, values in self.postings.items():
+            kept = [
+                self._pack(renumber[value >> 32], value & 0xFFFFFFFF)
+                for value in values if (value >> 32) in renumber
+            ]
+            if kept:
+                postings[term] = kept
+
+        self.session_ids = [self.session_ids[n] for n in live]
+        self.session_numbers = {sid: n for n, sid in enumerate(self.session_ids)}
+        self.deleted = set()
+        self.postings = {term: array('Q', values) for term, values in postings.items()}
+
+        old_log_path = self.log_path
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(dumps({
+                'generation': self.generation + 1,
+                'sessions': self.session_ids,
+                'postings': {term: _delta_encode(values) for term, values in postings.items()}
+            }))
+        os.replace(tmp_path, self.path)
+        self.generation += 1
+        if os.path.exists(old_log_path):
+            os.remove(old_log_path)
+        self.log_entries = 0
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = loads(f.read())
+            self.generation = data['generation']
+            self.session_ids = data['sessions']
+            self.session_numbers = {sid: n for n, sid in enumerate(self.session_ids)}
+            self.postings = {term: _delta_decode(values) for term, values in data['postings'].items()}
+        except FileNotFoundError:
+            pass
+
+        # A crash right after compaction can leave the previous log behind
+        stale_log = f"{self.path}.{self.generation - 1}.log"
+        if os.path.exists(stale_log):
+            os.remove(stale_log)
+
+        try:
+            with open(self.log_path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        # A crash mid-append can leave a partial last line
+                        continue
+                    if 'd' in entry:
+                        number = self.session_numbers.get(entry['d'])
+                        if number is not None:
+                            self.deleted.add(number)
+                    else:
+                        self._index(entry['s'], entry['p'], entry['t'])
+                    self.log_entries += 1
+        except FileNotFoundError:
+            pass
+
+class ChatSearchIndex:
+    """Per-user partitions of the chat search index, loaded on first use"""
+
+    def __init__(self, directory: str = SEARCH_DIR):
+        self.directory = directory
+        self.needs_backfill = not os.path.exists(os.path.join(directory, READY_MARKER))
+        if self.needs_backfill:
+            # A backfill that crashed part way leaves a partial index; start over
+            shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+        self.partitions: "OrderedDict[str, UserIndex]" = OrderedDict()
+
+    def mark_ready(self):
+        with open(os.path.join(self.directory, READY_MARKER), 'w'):
+            pass
+        self.needs_backfill = False
+
+    def _partition(self, user_id: str) -> UserIndex:
+        partition = self.partitions.get(user_id)
+        if partition is None:
+            # Hash the user id so any id is a safe file name
+            name = hashlib.sha256(user_id.encode()).hexdigest()[:32]
+            partition = self.partitions[user_id] = UserIndex(os.path.join(self.directory, name))
+            # Everything is on disk, so an evicted partition is simply reloaded
+            while len(self.partitions) > MAX_PARTITIONS:
+                self.partitions.popitem(last=False)
+        else:
+            self.partitions.move_to_end(user_id)
+        return partition
+
+    def add_message(self, user_id: str, session_id: str, position: int, content: str):
+        self._partition(user_id).add(session_id, position, content)
+
+    def remove_session(self, user_id: str, session_id: str):
+        self._partition(user_id).remove_session(session_id)
+
+    def search(self, user_id: str, query: str, limit: int = 20) -> List[Tuple[str, int]]:
+        return self._partition(user_id).search(query, limit)
@@ -1,20 +1,37 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
 import uuid
-from typing import Dict, List, Optional
-import json
+from typing import Callable, Dict, List, Optional, Tuple
+import gzip
 import os
-from models.chat import Message, ChatSession, ChatHistory
+from models.records import MessageRecord, SessionRecord, dumps, loads, parse_datetime
+from search_index import ChatSearchIndex
+
+ARCHIVE_DIR = 'data/archive'
 
 class SessionManager:
+    # Sessions idle for longer than this are moved to cold storage
+    SESSION_TTL = timedelta(hours=int(os.getenv("SESSION_TTL_HOURS", "24")))
+
     def __init__(self):
-        self.sessions: Dict[str, ChatSession] = {}
+        self.sessions: Dict[str, SessionRecord] = {}
         self.user_sessions: Dict[str, List[str]] = {}
+        # Small resident summary of each archived session, so listings never
+        # need to pull archived sessions back into memory
+        self.archived: Dict[str, dict] = {}
+        # Per-user counter bumped whenever the user's session list changes.
+        # The instance id keeps ETags from colliding across restarts.
+        self.user_versions: Dict[str, int] = {}
+        self.instance_id = uuid.uuid4().hex[:8]
+        self.search_index = ChatSearchIndex()
         self._load_sessions()
+        if self.search_index.needs_backfill:
+            self._backfill_search_index()
     
-    def create_session(self, user_id: str, document_id: Optional[str] = None) -> ChatSession:
+    def create_session(self, user_id: str, document_id: Optional[str] = None) -> SessionRecord:
         """Create a new chat session for a user"""
         session_id = str(uuid.uuid4())
-        session = ChatSession(
+        session = SessionRecord(
             session_id=session_id,
             user_id=user_id,
             messages=[],
@@ -28,67 +45,250 @@ class SessionManager:
             self.user_sessions[user_id] = []
         self.user_sessions[user_id].append(session_id)
         
+        self._bump_version(user_id)
         self._save_sessions()
         return session
     
-    def get_session(self, session_id: str) -> Optional[ChatSession]:
-        """Get a specific chat session"""
-        return self.sessions.get(session_id)
+    def get_session(self, session_id: str) -> Optional[SessionRecord]:
+        """Get a specific chat session, restoring it from the archive if needed"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self._restore_session(session_id)
+        return session
     
-    def get_user_sessions(self, user_id: str) -> List[ChatSession]:
-        """Get all chat sessions for a user"""
+    def get_user_sessions(self, user_id: str) -> List[SessionRecord]:
+        """Get all chat sessions for a user, reading archived ones without restoring them"""
         session_ids = self.user_sessions.get(user_id, [])
-        return [self.sessions[sid] for sid in session_ids if sid in self.sessions]
+        sessions = [self._peek_session(sid) for sid in session_ids]
+        return [session for session in sessions if session is not None]
+    
+    def get_user_session_summaries(self, user_id: str) -> List[dict]:
+        """Get lightweight summaries of a user's sessions, without messages"""
+        summaries = []
+        for sid in self.user_sessions.get(user_id, []):
+            session = self.sessions.get(sid)
+            if session is not None:
+                summaries.append(self._summarize(session))
+            elif sid in self.archived:
+                summaries.append(self.archived[sid])
+        return summaries
+    
+    def get_user_etag(self, user_id: str) -> str:
+        """ETag for the user's session list"""
+        return f'"{self.instance_id}-{self.user_versions.get(user_id, 0)}"'
     
-    def add_message(self, session_id: str, content: str, role: str) -> Optional[Message]:
+    def get_history_etag(self, session: SessionRecord) -> str:
+        """ETag for a session's message history; messages are only ever appended"""
+        return f'"{session.session_id}-{len(session.messages)}"'
+    
+    def add_message(self, session_id: str, content: str, role: str) -> Optional[MessageRecord]:
         """Add a message to a chat session"""
-        if session_id not in self.sessions:
+        session = self.get_session(session_id)
+        if session is None:
             return None
             
-        message = Message(
+        message = MessageRecord(
             content=content,
             timestamp=datetime.utcnow(),
             role=role
         )
         
-        self.sessions[session_id].messages.append(message)
-        self.sessions[session_id].last_updated = datetime.utcnow()
+        session.messages.append(message)
+        session.last_updated = datetime.utcnow()
+        self.search_index.add_message(
+            session.user_id, session_id, len(session.messages) - 1, content
+        )
+        self._bump_version(session.user_id)
         self._save_sessions()
         return message
     
+    def search_messages(self, user_id: str, query: str, limit: int = 20) -> List[dict]:
+        """Find a user's messages containing every word of the query"""
+        results = []
+        # Several hits often share a session; read each archive only once
+        sessions: Dict[str, Optional[SessionRecord]] = {}
+        for session_id, position in self.search_index.search(user_id, query, limit):
+            if session_id not in sessions:
+                sessions[session_id] = self._peek_session(session_id)
+            session = sessions[session_id]
+            if session is None or position >= len(session.messages):
+                continue
+            message = session.messages[position]
+            results.append({
+                "session_id": session_id,
+                "position": position,
+                **message.to_dict()
+            })
+        return results
+    
+    async def get_conversation_context(
+        self,
+        session_id: str,
+        recent_turns: int,
+        summarize: Callable[[Optional[str], List[MessageRecord]], str],
+        end: Optional[int] = None
+    ) -> Tuple[Optional[str], List[MessageRecord]]:
+        """Get the rolling summary and the last few turns of a session.
+
+        Messages that fall out of the verbatim window are folded into the
+        cached summary once, so each call only summarizes what is new.
+        Only messages before position `end` are considered, if given. The
+        summarize call runs in a worker thread; the session itself is only
+        changed on the event loop.
+        """
+        session = self.get_session(session_id)
+        if session is None:
+            return None, []
+        
+        if end is None:
+            end = len(session.messages)
+        window_start = max(end - recent_turns * 2, 0)
+        if window_start > session.summarized_count:
+            folded = session.summarized_count
+            pending = [
+                m for m in session.messages[folded:window_start]
+                if m.role != "system"
+            ]
+            summary = session.summary
+            if pending:
+                summary = await asyncio.to_thread(summarize, summary, pending)
+            # Another request on this session may have folded them meanwhile
+            if session.summarized_count == folded:
+                session.summary = summary
+                session.summarized_count = window_start
+                self._save_sessions()
+        
+        recent = [m for m in session.messages[window_start:end] if m.role != "system"]
+        return session.summary, recent
+    
     def delete_session(self, session_id: str, user_id: str) -> bool:
         """Delete a chat session"""
-        if session_id not in self.sessions or self.sessions[session_id].user_id != user_id:
+        session = self.get_session(session_id)
+        if session is None or session.user_id != user_id:
             return False
         
         del self.sessions[session_id]
         if user_id in self.user_sessions:
             self.user_sessions[user_id].remove(session_id)
+        self.search_index.remove_session(user_id, session_id)
+        self._bump_version(user_id)
         self._save_sessions()
         return True
     
+    def archive_idle_sessions(self) -> int:
+        """Move sessions idle past SESSION_TTL to compressed cold storage"""
+        cutoff = datetime.utcnow() - self.SESSION_TTL
+        idle = [
+            session for session in self.sessions.values()
+            if session.last_updated < cutoff
+        ]
+        if not idle:
+            return 0
+        
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        for session in idle:
+            with gzip.open(self._archive_path(session.session_id), 'wb') as f:
+                f.write(dumps(session.to_storage()))
+            self.archived[session.session_id] = self._summarize(session)
+            del self.sessions[session.session_id]
+        
+        self._save_sessions()
+        return len(idle)
+    
+    def _backfill_search_index(self):
+        """Index every existing session, resident or archived, then mark the index ready"""
+        for session in self.sessions.values():
+            self._index_session(session)
+        # Archives are read one at a time, so the backfill never holds them all
+        for session_id in self.archived:
+            session = self._read_archive(session_id)
+            if session is not None:
+                self._index_session(session)
+        self.search_index.mark_ready()
+    
+    def _index_session(self, session: SessionRecord):
+        for position, message in enumerate(session.messages):
+            self.search_index.add_message(session.user_id, session.session_id, position, message.content)
+    
+    def _bump_version(self, user_id: str):
+        self.user_versions[user_id] = self.user_versions.get(user_id, 0) + 1
+    
+    @staticmethod
+    def _summarize(session: SessionRecord) -> dict:
+        return {
+            "session_id": session.session_id,
+            "created_at": session.created_at,
+            "last_updated": session.last_updated,
+            "document_id": session.document_id,
+            "message_count": len(session.messages)
+        }
+    
+    def _peek_session(self, session_id: str) -> Optional[SessionRecord]:
+        """Get a session without making an archived one resident"""
+        session = self.sessions.get(session_id)
+        if session is None and session_id in self.archived:
+            session = self._read_archive(session_id)
+        return session
+    
+    def _read_archive(self, session_id: str) -> Optional[SessionRecord]:
+        try:
+            with gzip.open(self._archive_path(session_id), 'rb') as f:
+                return SessionRecord.from_storage(loads(f.read()))
+        except (FileNotFoundError, ValueError):
+            return None
+    
+    def _restore_session(self, session_id: str) -> Optional[SessionRecord]:
+        """Load an archived session back into memory"""
+        if session_id not in self.archived:
+            return None
+        session = self._read_archive(session_id)
+        if session is None:
+            return None
+        
+        self.sessions[session_id] = session
+        del self.archived[session_id]
+        os.remove(self._archive_path(session_id))
+        self._save_sessions()
+        return session
+    
+    def _archive_path(self, session_id: str) -> str:
+        # Session ids are uuids, but never let one escape the archive directory
+        return os.path.join(ARCHIVE_DIR, f"{os.path.basename(session_id)}.json.gz")
+    
     def _save_sessions(self):
         """Save sessions to disk"""
         os.makedirs('data', exist_ok=True)
-        with open('data/sessions.json', 'w') as f:
-            json.dump({
+        # Write a temp file and swap it in, so a crash never leaves a torn file
+        with open('data/sessions.json.tmp', 'wb') as f:
+            f.write(dumps({
                 'sessions': {
-                    sid: session.dict() 
+                    sid: session.to_storage()
                     for sid, session in self.sessions.items()
                 },
+                'archived': self.archived,
                 'user_sessions': self.user_sessions
-            }, f, default=str)
+            }))
+        os.replace('data/sessions.json.tmp', 'data/sessions.json')
     
     def _load_sessions(self):
         """Load sessions from disk"""
         try:
-            with open('data/sessions.json', 'r') as f:
-                data = json.load(f)
+            with open('data/sessions.json', 'rb') as f:
+                data = loads(f.read())
                 self.sessions = {
-                    sid: ChatSession(**session_data)
+                    sid: SessionRecord.from_storage(session_data)
                     for sid, session_data in data['sessions'].items()
                 }
                 self.user_sessions = data['user_sessions']
-        except (FileNotFoundError, json.JSONDecodeError):
+                self.archived = {
+                    sid: {
+                        **summary,
+                        "created_at": parse_datetime(summary["created_at"]),
+                        "last_updated": parse_datetime(summary["last_updated"])
+                    }
+                    for sid, summary in data.get('archived', {}).items()
+                }
+        except (FileNotFoundError, ValueError):
             self.sessions = {}
-            self.user_sessions = {} 
\ No newline at end of file
+            self.user_sessions = {}
+            self.archived = {} 
\ No newline at end of file
@@ -3,25 +3,80 @@ from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import CharacterTextSplitter
 from langchain_community.vectorstores import Pinecone
 from langchain.chains import RetrievalQA
+from langchain.chains.question_answering import load_qa_chain
 from langchain.callbacks.manager import CallbackManager
 import pinecone
 import os
-from llm_config import get_llm, get_embeddings, LLMProvider
-
-# Initialize Pinecone with host
-pinecone.init(
-    api_key=os.getenv("PINECONE_API_KEY"), 
-    environment=os.getenv("PINECONE_ENVIRONMENT"),
-    host=os.getenv("PINECONE_HOST")
-)
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional
+from llm_config import get_llm, get_embeddings, embed_queries, LLMProvider
+from models.records import MessageRecord
 
 # Get current LLM provider from environment
 llm_provider_value = os.getenv("LLM_PROVIDER", "mistral").split('#')[0].strip()
 current_provider = LLMProvider(llm_provider_value)
 
+# Number of recent user/assistant turns passed verbatim to the LLM
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "3"))
+
+# Maximum number of concurrent vector searches / LLM calls in a batch
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "8"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
 # Global variable for Pinecone index
 pinecone_index = None
 
+SUMMARY_PROMPT = """Progressively summarize the conversation, adding onto the previous summary and returning a new summary.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
+CONDENSE_PROMPT = """Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question.
+
+Conversation summary:
+{summary}
+
+Recent conversation:
+{history}
+
+Follow up question: {question}
+Standalone question:"""
+
+def get_text_splitter() -> CharacterTextSplitter:
+    """Chunking used for every document written to the vector store"""
+    return CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+
+def _format_messages(messages: List[MessageRecord]) -> str:
+    return "\n".join(f"{m.role}: {m.content}" for m in messages)
+
+def summarize_messages(summary: Optional[str], messages: List[MessageRecord]) -> str:
+    """Fold messages that left the recent window into the rolling summary"""
+    llm = get_llm(current_provider)
+    prompt = SUMMARY_PROMPT.format(
+        summary=summary or "",
+        new_lines=_format_messages(messages)
+    )
+    return llm.predict(prompt).strip()
+
+def _condense_question(query: str, summary: Optional[str], history: List[MessageRecord]) -> str:
+    """Rewrite a follow-up question so it can be answered without the chat history"""
+    if not summary and not history:
+        return query
+    llm = get_llm(current_provider)
+    prompt = CONDENSE_PROMPT.format(
+        summary=summary or "",
+        history=_format_messages(history),
+        question=query
+    )
+    return llm.predict(prompt).strip() or query
+
 def process_uploaded_file(file: UploadFile):
     global pinecone_index
     if file.content_type != "text/plain":
@@ -36,7 +91,7 @@ def process_uploaded_file(file: UploadFile):
     # Load and split the document
     loader = TextLoader(file_path)
     documents = loader.load()
-    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    text_splitter = get_text_splitter()
     texts = text_splitter.split_documents(documents)
     
     # Create embeddings and store in Pinecone
@@ -49,20 +104,118 @@ def process_uploaded_file(file: UploadFile):
     
     return {"message": "File uploaded and processed successfully"}
 
-def query_chatbot(query: str):
-    global pinecone_index
-    if pinecone_index is None:
-        raise HTTPException(status_code=400, detail="No documents uploaded yet")
+def store_texts(index: pinecone.Index, texts: List[str], embeddings, namespace: str):
+    """Embed texts and write them to a document namespace"""
+    Pinecone(index, embeddings, "text", namespace=namespace).add_texts(texts)
+
+def delete_namespace(index: pinecone.Index, namespace: str):
+    """Drop every vector stored under a document namespace"""
+    index.delete(delete_all=True, namespace=namespace)
+
+def query_chatbot(
+    query: str,
+    index: pinecone.Index,
+    namespace: str,
+    embeddings,
+    summary: Optional[str] = None,
+    history: Optional[List[MessageRecord]] = None
+):
+    """Answer a query from one document namespace, resolving follow-ups against the history"""
+    vectorstore = Pinecone(index, embeddings, "text", namespace=namespace)
     
     # Create the QA chain with callbacks
     qa = RetrievalQA.from_chain_type(
         llm=get_llm(current_provider),
         chain_type="stuff",
-        retriever=pinecone_index.as_retriever(),
+        retriever=vectorstore.as_retriever(),
         return_source_documents=True,  # Optional: return source docs
         callbacks=CallbackManager([])  # Empty callback manager if not using langsmith
     )
     
+    # Resolve follow-ups against the conversation memory
+    standalone_query = _condense_question(query, summary, history or [])
+    
     # Get the response
-    response = qa.run(query)
-    return {"response": response}
\ No newline at end of file
+    response = qa.run(standalone_query)
+    return {"response": response}
+
+async def run_batch_queries(
+    queries: List[str],
+    index: pinecone.Index,
+    namespace: str,
+    embeddings,
+    provider: LLMProvider,
+    top_k: int = 4
+) -> AsyncIterator[str]:
+    """Answer many queries against one namespace, yielding NDJSON lines as they finish.
+
+    All distinct queries are embedded in a single call, searched concurrently,
+    and answered with bounded LLM parallelism. Duplicate queries share one
+    search and one answer.
+    """
+    batch_start = time.perf_counter()
+    
+    # Identical queries only need to be searched and answered once
+    unique_queries = list(dict.fromkeys(q.strip() for q in queries))
+    
+    embed_start = time.perf_counter()
+    vectors = await asyncio.to_thread(embed_queries, embeddings, unique_queries)
+    embed_ms = (time.perf_counter() - embed_start) * 1000
+    
+    vectorstore = Pinecone(index, embeddings, "text", namespace=namespace)
+    llm = get_llm(provider)
+    qa_chain = load_qa_chain(llm, chain_type="stuff")
+    
+    search_semaphore = asyncio.Semaphore(BATCH_SEARCH_CONCURRENCY)
+    llm_semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+    
+    async def answer(query: str, vector: List[float]) -> dict:
+        timings = {"embed_ms": round(embed_ms, 1)}
+        stage, stage_start = "search_ms", time.perf_counter()
+        try:
+            async with search_semaphore:
+                stage_start = time.perf_counter()
+                results = await asyncio.to_thread(
+                    vectorstore.similarity_search_by_vector_with_score,
+                    vector,
+                    k=top_k,
+                    namespace=namespace
+                )
+                timings[stage] = round((time.perf_counter() - stage_start) * 1000, 1)
+            
+            stage = "llm_ms"
+            async with llm_semaphore:
+                stage_start = time.perf_counter()
+                response = await asyncio.to_thread(
+                    qa_chain.run, input_documents=[doc for doc, _ in results], question=query
+                )
+                timings[stage] = round((time.perf_counter() - stage_start) * 1000, 1)
+        except Exception as e:
+            # The failing stage is timed up to the point it failed
+            timings[stage] = round((time.perf_counter() - stage_start) * 1000, 1)
+            return {"query": query, "error": f"Error processing query: {str(e)}", "timings": timings}
+        
+        return {"query": query, "response": response, "timings": timings}
+    
+    tasks = [
+        asyncio.ensure_future(answer(query, vector))
+        for query, vector in zip(unique_queries, vectors)
+    ]
+    positions: Dict[str, List[int]] = {}
+    for index, query in enumerate(queries):
+        positions.setdefault(query.strip(), []).append(index)
+    
+    try:
+        for future in asyncio.as_completed(tasks):
+            result = await future
+            total_ms = (time.perf_counter() - batch_start) * 1000
+            for index in positions[result["query"]]:
+                yield json.dumps({
+                    "index": index,
+                    **result,
+                    "total_ms": round(total_ms, 1)
+                }) + "\n"
+    finally:
+        # Stop outstanding work if the client disconnects mid-stream
+        for task in tasks:
+            task.cancel()
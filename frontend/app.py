@@ -6,6 +6,31 @@ from datetime import datetime
 # Backend API URL
 BACKEND_URL = "http://localhost:8000"
 
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """Pooled HTTP session shared across Streamlit reruns"""
+    return requests.Session()
+
+http = get_http_session()
+
+def cached_get(path: str):
+    """GET a backend resource, reusing the local copy when the server answers 304"""
+    cache = st.session_state.setdefault("http_cache", {})
+    headers = {"Authorization": f"Bearer {st.session_state['access_token']}"}
+    if path in cache:
+        headers["If-None-Match"] = cache[path][0]
+    
+    response = http.get(f"{BACKEND_URL}{path}", headers=headers)
+    if response.status_code == 304:
+        return cache[path][1]
+    if response.status_code != 200:
+        return None
+    
+    data = response.json()
+    if "ETag" in response.headers:
+        cache[path] = (response.headers["ETag"], data)
+    return data
+
 def format_timestamp(timestamp_str: str) -> str:
     """Format timestamp for display"""
     dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
@@ -20,12 +45,13 @@ st.sidebar.header("Login")
 username = st.sidebar.text_input("Username")
 password = st.sidebar.text_input("Password", type="password")
 if st.sidebar.button("Login"):
-    response = requests.post(
+    response = http.post(
         f"{BACKEND_URL}/token",
         data={"username": username, "password": password}
     )
     if response.status_code == 200:
         st.session_state["access_token"] = response.json().get("access_token")
+        st.session_state.pop("http_cache", None)
         st.sidebar.success("Logged in successfully")
     else:
         st.sidebar.error("Login failed")
@@ -35,8 +61,10 @@ if "access_token" in st.session_state:
     # Sidebar - Session Management
     st.sidebar.header("Chat Sessions")
     if st.sidebar.button("New Chat"):
-        response = requests.post(
+        # New chats are opened on the most recently uploaded document
+        response = http.post(
             f"{BACKEND_URL}/chat/session",
+            params={"document_id": st.session_state.get("document_id")},
             headers={"Authorization": f"Bearer {st.session_state['access_token']}"}
         )
         if response.status_code == 200:
@@ -45,12 +73,8 @@ if "access_token" in st.session_state:
             st.experimental_rerun()
 
     # Get all sessions
-    response = requests.get(
-        f"{BACKEND_URL}/chat/sessions",
-        headers={"Authorization": f"Bearer {st.session_state['access_token']}"}
-    )
-    if response.status_code == 200:
-        sessions = response.json()
+    sessions = cached_get("/chat/sessions/summary")
+    if sessions is not None:
         if sessions:
             session_options = {
                 f"Session {s['session_id'][:8]} ({format_timestamp(s['created_at'])})": s['session_id']
@@ -67,17 +91,14 @@ if "access_token" in st.session_state:
             if "current_session" not in st.session_state or st.session_state["current_session"] != selected_session_id:
                 st.session_state["current_session"] = selected_session_id
                 # Load session history
-                history_response = requests.get(
-                    f"{BACKEND_URL}/chat/{selected_session_id}/history",
-                    headers={"Authorization": f"Bearer {st.session_state['access_token']}"}
-                )
-                if history_response.status_code == 200:
-                    st.session_state.messages = history_response.json()
+                history = cached_get(f"/chat/{selected_session_id}/history")
+                if history is not None:
+                    st.session_state.messages = history
                 st.experimental_rerun()
 
             # Delete session button
             if st.sidebar.button("Delete Session"):
-                delete_response = requests.delete(
+                delete_response = http.delete(
                     f"{BACKEND_URL}/chat/session/{selected_session_id}",
                     headers={"Authorization": f"Bearer {st.session_state['access_token']}"}
                 )
@@ -92,8 +113,9 @@ if "access_token" in st.session_state:
     if uploaded_file is not None:
         files = {"file": uploaded_file.getvalue()}
         headers = {"Authorization": f"Bearer {st.session_state['access_token']}"}
-        response = requests.post(f"{BACKEND_URL}/upload/", files=files, headers=headers)
+        response = http.post(f"{BACKEND_URL}/upload/", files=files, headers=headers)
         if response.status_code == 200:
+            st.session_state["document_id"] = response.json().get("document_id")
             st.sidebar.success(response.json().get("message"))
         else:
             st.sidebar.error("Upload failed. Admin access required.")
@@ -110,7 +132,7 @@ if "access_token" in st.session_state:
     if prompt := st.chat_input("Ask a question:"):
         if "current_session" in st.session_state:
             headers = {"Authorization": f"Bearer {st.session_state['access_token']}"}
-            response = requests.post(
+            response = http.post(
                 f"{BACKEND_URL}/chat/{st.session_state['current_session']}",
                 json={"query": prompt},
                 headers=headers
@@ -135,7 +157,7 @@ def show_register_page():
         password = st.text_input("Password", type="password")
         
         if st.form_submit_button("Register"):
-            response = requests.post(
+            response = http.post(
                 f"{BACKEND_URL}/register",
                 json={"email": email, "password": password}
             )
@@ -153,7 +175,7 @@ def show_login_page():
         password = st.text_input("Password", type="password")
         
         if st.form_submit_button("Login"):
-            response = requests.post(
+            response = http.post(
                 f"{BACKEND_URL}/token",
                 data={"username": email, "password": password}  # OAuth2 form expects 'username'
             )